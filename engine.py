@@ -7,6 +7,8 @@ from fake_client import FakeClient
 from modbus_client import ModbusClient
 from mqtt_client import MQTTClient
 from process_inverter_data import ProcessInverterData
+from state_cache import StateCache
+from state_server import StateServer
 
 def setup_logging():
     """Configure logging with both file and console handlers."""
@@ -44,12 +46,26 @@ class Engine:
         self.mqtt_topic = "paxyhome/Inverter/"
         self.fake_client_update_frequency = 10
         self.real_modbus_server = "47.242.188.205"
+        self.payload_format = "json"
+        self.payload_delta = False
+        self.payload_keyframe_interval = 60
+        self.mqtt_qos = 1
+        self.mqtt_filter = "*"
+        self.mqtt_queue_size = 1000
+        self.mqtt_sinks = []
+        self.state_api = False
+        self.state_api_host = "127.0.0.1"
+        self.state_api_port = 8080
+        self.state_stale_after = 30
         
         self.pool = ThreadPoolExecutor(max_workers=4)
         self.nsrv = None
         self.ncli = None
         self.mqtt = None
         self.last_data = None
+        self.last_frame = None  # (device, data) of the latest frame
+        self.state = None
+        self.state_server = None
         
         self.load_config()
         self.initialize_components()
@@ -68,18 +84,62 @@ class Engine:
             self.mqtt_pass = settings.get('mqttPass', self.mqtt_pass)
             self.mqtt_topic = settings.get('mqttTopic', self.mqtt_topic)
             self.fake_client_update_frequency = settings.getint('updateFrequency', self.fake_client_update_frequency)
+            self.payload_format = settings.get('payloadFormat', self.payload_format)
+            self.payload_delta = settings.getboolean('payloadDelta', self.payload_delta)
+            self.payload_keyframe_interval = settings.getint('payloadKeyframeInterval', self.payload_keyframe_interval)
+            self.mqtt_qos = settings.getint('mqttQos', self.mqtt_qos)
+            self.mqtt_filter = settings.get('mqttFilter', self.mqtt_filter)
+            self.mqtt_queue_size = settings.getint('mqttQueueSize', self.mqtt_queue_size)
+
+            # Each [sink:<name>] section is an MQTT endpoint; without any,
+            # the broker from [DEFAULT] is the only sink
+            self.mqtt_sinks = [
+                self.load_sink_config(section[len('sink:'):], config[section])
+                for section in config.sections() if section.startswith('sink:')
+            ]
+            if not self.mqtt_sinks:
+                self.mqtt_sinks = [self.load_sink_config('default', settings)]
+
+            self.state_api = settings.getboolean('stateApi', self.state_api)
+            self.state_api_host = settings.get('stateApiHost', self.state_api_host)
+            self.state_api_port = settings.getint('stateApiPort', self.state_api_port)
+            self.state_stale_after = settings.getint('stateStaleAfter', self.state_stale_after)
             
             self.logger.info("Configuration loaded successfully")
             self.logger.debug(f"MQTT Server: {self.mqtt_server}:{self.mqtt_port}")
             self.logger.debug(f"MQTT Topic: {self.mqtt_topic}")
+            self.logger.debug(f"MQTT Sinks: {', '.join(sink['name'] for sink in self.mqtt_sinks)}")
             self.logger.debug(f"Fake Client Mode: {self.fake_client}")
+            self.logger.debug(f"Payload Format: {self.payload_format} (delta: {self.payload_delta})")
         except Exception as e:
             self.logger.error(f"Error loading config: {e}")
             raise
 
+    def load_sink_config(self, name, section):
+        """Read one MQTT sink, falling back to the [DEFAULT] broker settings."""
+        return {
+            'name': name,
+            'server': section.get('mqttServer', self.mqtt_server),
+            'port': section.getint('mqttPort', self.mqtt_port),
+            'enable_auth': section.getboolean('enableMqttAuth', self.enable_mqtt_auth),
+            'user': section.get('mqttUser', self.mqtt_user),
+            'password': section.get('mqttPass', self.mqtt_pass),
+            'topic': section.get('mqttTopic', self.mqtt_topic),
+            'qos': section.getint('mqttQos', self.mqtt_qos),
+            'filter': [pattern.strip() for pattern in
+                       section.get('mqttFilter', self.mqtt_filter).split(',') if pattern.strip()],
+            'queue_size': section.getint('mqttQueueSize', self.mqtt_queue_size),
+        }
+
     def initialize_components(self):
         try:
             self.logger.info("Initializing components...")
+            # Latest decoded state, served by the optional state API
+            self.state = StateCache(self.state_stale_after)
+            if self.state_api:
+                self.state_server = StateServer(self)
+                self.state_server.start()
+
             # Initialize ModbusServer
             self.nsrv = ModbusServer(self)
             self.pool.submit(self.nsrv.run)
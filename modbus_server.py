@@ -22,7 +22,7 @@ class ModbusServer:
                     
                     # Handle client in a separate thread
                     client_thread = threading.Thread(target=self.handle_client, 
-                                                  args=(client_socket,))
+                                                  args=(client_socket, address))
                     client_thread.daemon = True
                     client_thread.start()
                 except Exception as e:
@@ -34,12 +34,14 @@ class ModbusServer:
             if self.server_socket:
                 self.server_socket.close()
 
-    def handle_client(self, client_socket):
+    def handle_client(self, client_socket, address):
         try:
             while self.running:
                 data = client_socket.recv(1024)
                 if not data:
                     break
+                # Device and frame are stored together so they cannot mix
+                self.engine.last_frame = (address[0], data)
                 self.engine.last_data = data
                 # Process the received data here
         except Exception as e:
@@ -0,0 +1,337 @@
+import paho.mqtt.client as mqtt
+import json
+import logging
+import time
+from fnmatch import fnmatch
+from queue import Queue, Empty, Full
+from threading import Condition, Event, Lock, RLock, Thread
+from payload_encoder import PayloadEncoder
+
+class MQTTSink:
+    """A single MQTT broker endpoint with its own connection and bounded queue.
+
+    Messages are queued by the producer threads and published from the
+    sink's own worker thread, so a slow or unreachable broker never blocks
+    the decode path or the other sinks. When the queue is full the oldest
+    message is dropped in favour of the newest one.
+
+    At most `MAX_INFLIGHT` messages are handed to paho until the broker
+    confirms them (on_publish), so a slow broker backs up into the bounded
+    queue instead of paho's own unbounded one.
+    """
+
+    DATA_TOPIC = "data"
+    MAX_INFLIGHT = 20  # paho's default in-flight window for QoS > 0
+
+    def __init__(self, engine, config):
+        self.engine = engine
+        self.name = config["name"]
+        self.server = config["server"]
+        self.port = config["port"]
+        self.topic = config["topic"]
+        self.qos = config["qos"]
+        self.filters = config["filter"]
+        self.logger = logging.getLogger(f"{__name__}.{self.name}")
+
+        self.client = mqtt.Client()
+        self.connected = False
+        self.connect_lock = Lock()
+        self.stop_event = Event()
+        self.reconnect_delay = 1  # Start with 1 second delay
+        self.max_reconnect_delay = 60  # Maximum delay of 60 seconds
+        self.stats_interval = 100  # Log payload size stats every N samples
+
+        # A maxsize of 0 or less would make Queue unbounded
+        self.queue = Queue(maxsize=max(1, config["queue_size"]))
+        self.queue_lock = Lock()
+        self.thread = None
+
+        # mid -> enqueue time of messages handed to paho but not yet confirmed.
+        # Reentrant because paho may call on_publish from inside publish()
+        self.inflight = {}
+        self.inflight_cond = Condition(RLock())
+        # Hard cap on paho's queue, with headroom for the retained schema
+        # and messages paho retries from a previous session
+        self.client.max_queued_messages_set(2 * self.MAX_INFLIGHT)
+
+        # Metrics
+        self.metrics_lock = Lock()
+        self.enqueued = 0
+        self.published = 0
+        self.dropped = 0
+        self.filtered = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_publish_time = None
+
+        # Encoder for the consolidated data topic, per sink so delta state
+        # follows what this broker actually received
+        self.encoder = PayloadEncoder(
+            self.engine.payload_format,
+            self.engine.payload_delta,
+            self.engine.payload_keyframe_interval
+        )
+
+        # Set up callbacks
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+
+        # Configure authentication if enabled
+        if config["enable_auth"]:
+            self.client.username_pw_set(config["user"], config["password"])
+            self.logger.info("MQTT authentication configured")
+
+    def on_connect(self, client, userdata, flags, rc):
+        """Callback for when the client receives a CONNACK response from the server."""
+        if rc == 0:
+            self.logger.info(f"Successfully connected to MQTT broker {self.name}")
+            with self.connect_lock:
+                self.connected = True
+                self.reconnect_delay = 1  # Reset reconnect delay on successful connection
+            with self.inflight_cond:
+                # Confirmations for the previous session may never arrive;
+                # paho's own queue limit still bounds any it retries
+                self.inflight.clear()
+                self.inflight_cond.notify_all()
+            self.publish_schema()
+        else:
+            self.logger.error(f"Failed to connect to MQTT broker {self.name} with result code: {rc}")
+            self.handle_connection_error(rc)
+
+    def on_disconnect(self, client, userdata, rc):
+        """Callback for when the client disconnects from the server."""
+        with self.connect_lock:
+            self.connected = False
+        if rc != 0:
+            self.logger.warning(f"Unexpected MQTT disconnection from {self.name} with result code: {rc}")
+        else:
+            self.logger.info(f"MQTT client disconnected from {self.name}")
+
+    def on_publish(self, client, userdata, mid):
+        """Callback for when a message is published."""
+        self.logger.debug(f"Message {mid} published successfully")
+        with self.inflight_cond:
+            enqueued_at = self.inflight.pop(mid, None)
+            self.inflight_cond.notify_all()
+        if enqueued_at is None:
+            return
+
+        # Lag runs from enqueue until the broker confirmed the message
+        now = time.time()
+        lag = now - enqueued_at
+        with self.metrics_lock:
+            self.published += 1
+            self.last_publish_time = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def handle_connection_error(self, rc):
+        """Handle different connection error scenarios."""
+        error_messages = {
+            1: "Incorrect protocol version",
+            2: "Invalid client identifier",
+            3: "Server unavailable",
+            4: "Bad username or password",
+            5: "Not authorized"
+        }
+        error_msg = error_messages.get(rc, f"Unknown error code: {rc}")
+        self.logger.error(f"MQTT Connection Error: {error_msg}")
+
+        if rc in [4, 5]:  # Auth related errors
+            self.logger.critical(f"Authentication failed for {self.name}. Please check credentials.")
+            self.stop_event.set()  # Stop reconnection attempts
+
+    def connect_with_retry(self):
+        """Attempt to connect to the MQTT broker with exponential backoff."""
+        while not self.stop_event.is_set():
+            try:
+                self.logger.info(f"Attempting to connect to MQTT broker at {self.server}:{self.port}")
+                self.client.connect(self.server, self.port)
+                return True
+            except Exception as e:
+                self.logger.error(f"Failed to connect to MQTT broker {self.name}: {str(e)}")
+                self.logger.info(f"Retrying in {self.reconnect_delay} seconds...")
+                self.stop_event.wait(self.reconnect_delay)
+
+                # Implement exponential backoff
+                self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+        return False
+
+    def accepts(self, topic):
+        """Check the topic against the sink's filter patterns."""
+        return any(fnmatch(topic, pattern) for pattern in self.filters)
+
+    def enqueue(self, topic, value):
+        """Queue a message without blocking, dropping the oldest one when full."""
+        if not self.accepts(topic):
+            with self.metrics_lock:
+                self.filtered += 1
+            return False
+
+        item = (topic, value, time.time())
+        with self.queue_lock:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except Full:
+                    try:
+                        self.queue.get_nowait()
+                        with self.metrics_lock:
+                            self.dropped += 1
+                    except Empty:
+                        pass
+        with self.metrics_lock:
+            self.enqueued += 1
+        return True
+
+    def publish_schema(self):
+        """Publish the retained payload schema so consumers can decode the data topic."""
+        try:
+            topic = f"{self.topic}{self.DATA_TOPIC}/schema"
+            self.client.publish(topic, json.dumps(self.encoder.schema()), qos=self.qos, retain=True)
+        except Exception as e:
+            self.logger.error(f"Error publishing payload schema: {e}")
+
+    def process_data(self, data, timestamp):
+        """Encode a raw frame for the consolidated data topic."""
+        try:
+            payload = self.encoder.encode(data, timestamp)
+            if self.encoder.samples % self.stats_interval == 0:
+                stats = self.encoder.stats()
+                self.logger.info(
+                    f"Payload {stats['format']}: {stats['avg_encoded_bytes']:.1f} bytes/sample "
+                    f"vs {stats['avg_baseline_bytes']:.1f} for json "
+                    f"({stats['saved_ratio']:.0%} saved)"
+                )
+            return payload
+        except Exception as e:
+            self.logger.error(f"Error processing data: {e}")
+            return None
+
+    def publish(self, topic, value, timestamp):
+        """Publish a queued message to this sink's broker."""
+        if topic == self.DATA_TOPIC:
+            payload = self.process_data(value, timestamp)
+            if payload is None:
+                return False
+        else:
+            payload = str(value)
+
+        full_topic = f"{self.topic}{topic}"
+        try:
+            # Hold the lock so on_publish cannot run before the mid is tracked
+            with self.inflight_cond:
+                result = self.client.publish(full_topic, payload, qos=self.qos)
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    self.inflight[result.mid] = timestamp
+        except Exception:
+            self._publish_failed(topic)
+            raise
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.logger.error(f"Failed to publish message to {full_topic}: {mqtt.error_string(result.rc)}")
+            self._publish_failed(topic)
+            with self.metrics_lock:
+                if result.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                    self.dropped += 1
+                else:
+                    self.failed += 1
+            return False
+
+        self.logger.debug(f"Published data to {full_topic}")
+        return True
+
+    def _publish_failed(self, topic):
+        """Keep the delta base in line with what the broker actually received."""
+        if topic == self.DATA_TOPIC:
+            self.encoder.reset()
+
+    def oldest_pending_age(self, now=None):
+        """Seconds the message at the head of the queue has been waiting, 0 if empty."""
+        if now is None:
+            now = time.time()
+        with self.queue.mutex:
+            if not self.queue.queue:
+                return 0.0
+            return now - self.queue.queue[0][2]
+
+    def metrics(self):
+        """Return queue, lag and drop metrics for this sink.
+
+        last_lag/max_lag run from enqueue until the broker confirmed the
+        message; oldest_pending_age keeps growing while the broker is down
+        or slow and nothing is confirmed.
+        """
+        with self.metrics_lock:
+            return {
+                "server": f"{self.server}:{self.port}",
+                "connected": self.connected,
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "inflight": len(self.inflight),
+                "enqueued": self.enqueued,
+                "published": self.published,
+                "dropped": self.dropped,
+                "filtered": self.filtered,
+                "failed": self.failed,
+                "oldest_pending_age": self.oldest_pending_age(),
+                "last_lag": self.last_lag,
+                "max_lag": self.max_lag,
+                "last_publish_time": self.last_publish_time,
+            }
+
+    def start(self):
+        """Start the sink's worker thread."""
+        self.thread = Thread(target=self.run, name=f"mqtt-sink-{self.name}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Main run loop: connect and drain the queue to the broker."""
+        self.logger.info(f"Starting MQTT sink {self.name}...")
+
+        if not self.connect_with_retry():
+            self.logger.error(f"Failed to establish initial connection to {self.name}. Exiting.")
+            return
+
+        try:
+            self.client.loop_start()
+
+            while not self.stop_event.is_set():
+                if not self.connected:
+                    # The network loop reconnects on its own; keep queueing
+                    # (and dropping the oldest) until it does
+                    self.stop_event.wait(1)
+                    continue
+
+                # Leave messages in the bounded queue while the broker
+                # has not confirmed the previous ones
+                with self.inflight_cond:
+                    if not self.inflight_cond.wait_for(
+                            lambda: len(self.inflight) < self.MAX_INFLIGHT, timeout=1):
+                        continue
+
+                try:
+                    topic, value, enqueued_at = self.queue.get(timeout=1)
+                except Empty:
+                    continue
+
+                try:
+                    self.publish(topic, value, enqueued_at)
+                except Exception as e:
+                    self.logger.error(f"Error publishing to {topic}: {e}")
+                    with self.metrics_lock:
+                        self.failed += 1
+
+        except Exception as e:
+            self.logger.error(f"Error in MQTT sink {self.name} run loop: {str(e)}")
+        finally:
+            self.logger.info(f"Shutting down MQTT sink {self.name}...")
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def stop(self):
+        """Gracefully stop the sink."""
+        self.logger.info(f"Stopping MQTT sink {self.name}...")
+        self.stop_event.set()
@@ -0,0 +1,248 @@
+import json
+import struct
+import time
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, only needed for payloadFormat=msgpack
+    msgpack = None
+
+
+class PayloadEncoder:
+    """Encode raw inverter frames for the consolidated MQTT data topic.
+
+    Supported formats:
+      - json:    the original {"raw_data": <hex>, "timestamp": <float>} document
+      - packed:  versioned binary struct, raw frame carried as bytes
+      - msgpack: MessagePack map, raw frame carried as bytes (needs msgpack)
+
+    The binary formats can optionally delta-encode a frame against the
+    previous frame of the same type (bytes 2-3, e.g. 0x0925 status or
+    0x0001 command response), sending only the changed byte runs. Each
+    frame type keeps its own delta chain, so interleaved types do not
+    force keyframes. A full frame (keyframe) is sent every
+    `keyframe_interval` samples of a type and whenever its frame length
+    changes, so late subscribers can resynchronise. Every sample carries a
+    sequence number and every delta the sequence number of its base, so
+    decoders can detect a lost sample.
+    """
+
+    FORMATS = ("json", "packed", "msgpack")
+    VERSION = 2
+
+    FLAG_DELTA = 0x01
+
+    # version, flags, sequence, base sequence (deltas only),
+    # timestamp (ms since epoch), frame/delta length
+    HEADER = struct.Struct("!BBIIQH")
+    MAX_SEQUENCE = 0xFFFFFFFF
+    # offset, length of a changed byte run in a delta payload
+    RUN = struct.Struct("!HB")
+    MAX_RUN = 0xFF
+
+    def __init__(self, payload_format="json", delta=False, keyframe_interval=60):
+        if payload_format not in self.FORMATS:
+            raise ValueError(f"Unknown payload format: {payload_format}")
+        if payload_format == "msgpack" and msgpack is None:
+            raise ImportError("payloadFormat=msgpack requires the msgpack package")
+        self.payload_format = payload_format
+        self.delta = delta and payload_format != "json"
+        self.keyframe_interval = max(1, keyframe_interval)
+        # Delta base per frame type: (sequence, frame, samples since keyframe)
+        self.bases = {}
+        self.sequence = 0
+
+        # Bytes on the wire for the selected format vs the original JSON format
+        self.samples = 0
+        self.encoded_bytes = 0
+        self.baseline_bytes = 0
+
+    def schema(self):
+        """Describe the payload layout, published retained next to the data topic."""
+        schema = {
+            "format": self.payload_format,
+            "version": self.VERSION,
+            "delta": self.delta,
+            "keyframe_interval": self.keyframe_interval,
+            "delta_base": "previous sample with the same frame type (bytes 2-3)",
+        }
+        if self.payload_format == "packed":
+            schema["header"] = "!BBIIQH (version, flags, sequence, base_sequence, timestamp_ms, length)"
+            schema["delta_run"] = "!HB (offset, length) followed by the new bytes"
+            schema["flags"] = {"delta": self.FLAG_DELTA}
+        elif self.payload_format == "msgpack":
+            schema["keys"] = {
+                "v": "version",
+                "s": "sequence",
+                "b": "base sequence (delta)",
+                "t": "timestamp_ms",
+                "f": "raw frame (keyframe)",
+                "d": "list of [offset, bytes] runs (delta)",
+            }
+        return schema
+
+    def encode(self, data, timestamp=None):
+        """Encode a raw frame, returning the payload to publish."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        baseline = self._encode_json(data, timestamp)
+        if self.payload_format == "json":
+            payload = baseline
+        else:
+            key = self.frame_type(data)
+            base = self.bases.get(key)
+            runs = self._diff(data, base)
+            base_sequence = base[0] if runs is not None else None
+            if self.payload_format == "packed":
+                payload = self._encode_packed(data, runs, base_sequence, timestamp)
+            else:
+                payload = self._encode_msgpack(data, runs, base_sequence, timestamp)
+            since_keyframe = 0 if runs is None else base[2] + 1
+            self.bases[key] = (self.sequence, bytes(data), since_keyframe)
+            self.sequence = (self.sequence + 1) & self.MAX_SEQUENCE
+
+        self.samples += 1
+        self.encoded_bytes += len(payload)
+        self.baseline_bytes += len(baseline)
+        return payload
+
+    def reset(self):
+        """Forget the delta bases so the next sample is sent as a keyframe.
+
+        Call this when a payload could not be delivered, otherwise later
+        deltas would be computed against a frame the receiver never saw.
+        """
+        self.bases = {}
+
+    @staticmethod
+    def frame_type(data):
+        """Key frames by their type bytes, each type has its own delta chain."""
+        return bytes(data[2:4])
+
+    def stats(self):
+        """Return bytes-on-the-wire counters against the original JSON format."""
+        saved = self.baseline_bytes - self.encoded_bytes
+        return {
+            "format": self.payload_format,
+            "samples": self.samples,
+            "encoded_bytes": self.encoded_bytes,
+            "baseline_bytes": self.baseline_bytes,
+            "avg_encoded_bytes": self.encoded_bytes / self.samples if self.samples else 0,
+            "avg_baseline_bytes": self.baseline_bytes / self.samples if self.samples else 0,
+            "saved_ratio": saved / self.baseline_bytes if self.baseline_bytes else 0,
+        }
+
+    @staticmethod
+    def _encode_json(data, timestamp):
+        return json.dumps({
+            "raw_data": data.hex(),
+            "timestamp": timestamp
+        })
+
+    def _diff(self, data, base):
+        """Return changed (offset, bytes) runs against the base frame, or None for a keyframe."""
+        if (not self.delta or base is None
+                or len(base[1]) != len(data)
+                or base[2] >= self.keyframe_interval - 1):
+            return None
+
+        previous = base[1]
+        runs = []
+        idx = 0
+        while idx < len(data):
+            if data[idx] == previous[idx]:
+                idx += 1
+                continue
+            start = idx
+            while (idx < len(data) and data[idx] != previous[idx]
+                   and idx - start < self.MAX_RUN):
+                idx += 1
+            runs.append((start, bytes(data[start:idx])))
+
+        # A delta is only worth sending when it is smaller than the frame itself
+        if sum(self.RUN.size + len(run) for _, run in runs) >= len(data):
+            return None
+        return runs
+
+    def _encode_packed(self, data, runs, base_sequence, timestamp):
+        ts_ms = int(timestamp * 1000)
+        if runs is None:
+            return self.HEADER.pack(self.VERSION, 0, self.sequence, 0, ts_ms, len(data)) + bytes(data)
+        body = b"".join(self.RUN.pack(offset, len(run)) + run for offset, run in runs)
+        return self.HEADER.pack(self.VERSION, self.FLAG_DELTA, self.sequence,
+                                base_sequence, ts_ms, len(body)) + body
+
+    def _encode_msgpack(self, data, runs, base_sequence, timestamp):
+        message = {"v": self.VERSION, "s": self.sequence, "t": int(timestamp * 1000)}
+        if runs is None:
+            message["f"] = bytes(data)
+        else:
+            message["b"] = base_sequence
+            message["d"] = [[offset, run] for offset, run in runs]
+        return msgpack.packb(message, use_bin_type=True)
+
+
+class PayloadDecoder:
+    """Reverse of PayloadEncoder for the packed and msgpack formats.
+
+    A delta whose base sequence does not match the last decoded sample of
+    any frame type raises ValueError, and every following delta of that
+    chain is rejected until the next keyframe arrives.
+    """
+
+    def __init__(self):
+        # Last decoded sample per frame type: (sequence, frame)
+        self.bases = {}
+
+    def decode_packed(self, payload):
+        """Decode a packed payload, returning (timestamp, frame)."""
+        version, flags, sequence, base, ts_ms, length = PayloadEncoder.HEADER.unpack_from(payload)
+        self._check_version(version)
+        body = payload[PayloadEncoder.HEADER.size:PayloadEncoder.HEADER.size + length]
+
+        if not flags & PayloadEncoder.FLAG_DELTA:
+            return ts_ms / 1000, self._keyframe(sequence, body)
+
+        runs = []
+        idx = 0
+        while idx < len(body):
+            offset, run_len = PayloadEncoder.RUN.unpack_from(body, idx)
+            idx += PayloadEncoder.RUN.size
+            runs.append((offset, body[idx:idx + run_len]))
+            idx += run_len
+        return ts_ms / 1000, self._apply_delta(sequence, base, runs)
+
+    def decode_msgpack(self, payload):
+        """Decode a msgpack payload, returning (timestamp, frame)."""
+        message = msgpack.unpackb(payload, raw=False)
+        self._check_version(message["v"])
+
+        if "f" in message:
+            return message["t"] / 1000, self._keyframe(message["s"], message["f"])
+        return message["t"] / 1000, self._apply_delta(message["s"], message["b"], message["d"])
+
+    @staticmethod
+    def _check_version(version):
+        if version != PayloadEncoder.VERSION:
+            raise ValueError(f"Unsupported payload version: {version}")
+
+    def _keyframe(self, sequence, frame):
+        frame = bytes(frame)
+        self.bases[PayloadEncoder.frame_type(frame)] = (sequence, frame)
+        return frame
+
+    def _apply_delta(self, sequence, base, runs):
+        # The base is only found if no sample of its chain was lost; a
+        # failed delta is not stored, so later deltas of the chain fail too
+        key = next((key for key, (base_sequence, _) in self.bases.items()
+                    if base_sequence == base), None)
+        if key is None:
+            raise ValueError(f"Delta payload {sequence} is based on {base}, missing samples")
+
+        frame = bytearray(self.bases[key][1])
+        for offset, run in runs:
+            frame[offset:offset + len(run)] = run
+        frame = bytes(frame)
+        self.bases[key] = (sequence, frame)
+        return frame
@@ -25,78 +25,77 @@ class ProcessInverterData:
         while True:
             try:
                 # Wait for data to be available
-                while self.engine.last_data is None or len(self.engine.last_data) == 0:
+                while self.engine.last_frame is None or len(self.engine.last_frame[1]) == 0:
                     time.sleep(0.1)
                 
-                data = self.engine.last_data
+                device, data = self.engine.last_frame
                 hex_data = data.hex()
 
                 # Process data type 0x0925
                 if data[2] == 0x09 and data[3] == 0x25:
-                    self._process_status_data(data)
+                    self._process_status_data(data, device)
                 
                 # Process data type 0x0001
                 if data[2] == 0x00 and data[3] == 0x01:
-                    self._process_command_response(hex_data)
+                    self._process_command_response(hex_data, device)
 
+                self.engine.last_frame = None
                 self.engine.last_data = None
 
             except Exception as e:
                 print(f"Error processing inverter data: {e}")
 
-    def _process_status_data(self, data):
+    def _process_status_data(self, data, device):
         """Process the status data packet (type 0x0925)"""
+        fields = {}
+
         # Battery data
-        battery_voltage = self._get_data(data, self.battery_voltage_idx, 10)
-        self.engine.mqtt.send_msg("batteryVoltage", battery_voltage)
+        fields["batteryVoltage"] = self._get_data(data, self.battery_voltage_idx, 10)
         
-        battery_charged = self._get_data_int(data, self.battery_charged_idx)
-        self.engine.mqtt.send_msg("batteryCharged", battery_charged)
+        fields["batteryCharged"] = self._get_data_int(data, self.battery_charged_idx)
         
-        battery_charging_curr = self._get_data(data, self.battery_charging_curr_idx, 10)
-        self.engine.mqtt.send_msg("batteryChargingCurr", battery_charging_curr)
+        fields["batteryChargingCurr"] = self._get_data(data, self.battery_charging_curr_idx, 10)
         
-        battery_discharging_curr = self._get_data(data, self.battery_discharging_curr_idx, 10)
-        self.engine.mqtt.send_msg("batteryDisChargingCurr", battery_discharging_curr)
+        fields["batteryDisChargingCurr"] = self._get_data(data, self.battery_discharging_curr_idx, 10)
 
         # Output data
-        output_voltage = self._get_data(data, self.output_voltage_idx, 10)
-        self.engine.mqtt.send_msg("outputVoltage", output_voltage)
+        fields["outputVoltage"] = self._get_data(data, self.output_voltage_idx, 10)
         
-        output_frequency = self._get_data(data, self.output_frequency_idx, 10)
-        self.engine.mqtt.send_msg("outputFrequency", output_frequency)
+        fields["outputFrequency"] = self._get_data(data, self.output_frequency_idx, 10)
         
-        output_power = self._get_data_int(data, self.output_power_idx)
-        self.engine.mqtt.send_msg("outputPower", output_power)
+        fields["outputPower"] = self._get_data_int(data, self.output_power_idx)
         
-        output_load = self._get_data_int(data, self.output_load_idx)
-        self.engine.mqtt.send_msg("outputLoad", output_load)
+        fields["outputLoad"] = self._get_data_int(data, self.output_load_idx)
 
         # AC data
-        ac_voltage = self._get_data(data, self.ac_voltage_idx, 10)
-        self.engine.mqtt.send_msg("acVoltage", ac_voltage)
+        fields["acVoltage"] = self._get_data(data, self.ac_voltage_idx, 10)
         
-        ac_frequency = self._get_data(data, self.ac_frequency_idx, 10)
-        self.engine.mqtt.send_msg("acFrequency", ac_frequency)
+        fields["acFrequency"] = self._get_data(data, self.ac_frequency_idx, 10)
 
         # PV data
-        pv_voltage = self._get_data(data, self.pv_voltage_idx, 10)
-        self.engine.mqtt.send_msg("pvVoltage", pv_voltage)
+        fields["pvVoltage"] = self._get_data(data, self.pv_voltage_idx, 10)
         
-        pv_power = self._get_data_int(data, self.pv_power_idx)
-        self.engine.mqtt.send_msg("pvPower", pv_power)
+        fields["pvPower"] = self._get_data_int(data, self.pv_power_idx)
 
         # Mode and state data
-        mode = self._get_data_int(data, self.mode_idx)
-        self.engine.mqtt.send_msg("mode", mode)
+        fields["mode"] = self._get_data_int(data, self.mode_idx)
         
-        charge_state = self._get_data_int(data, self.charge_state_idx)
-        self.engine.mqtt.send_msg("chargeState", charge_state)
+        fields["chargeState"] = self._get_data_int(data, self.charge_state_idx)
         
-        load_state = self._get_data_int(data, self.load_state_idx)
-        self.engine.mqtt.send_msg("loadState", load_state)
+        fields["loadState"] = self._get_data_int(data, self.load_state_idx)
+
+        self._publish_fields(fields, device)
+
+    def _publish_fields(self, fields, device):
+        """Send decoded fields to MQTT and the state snapshot"""
+        if not fields:
+            return
+        for name, value in fields.items():
+            self.engine.mqtt.send_msg(name, value)
+        if self.engine.state is not None:
+            self.engine.state.update(device, fields)
 
-    def _process_command_response(self, hex_data):
+    def _process_command_response(self, hex_data, device):
         """Process command response data (type 0x0001)"""
         charge_state = -1
         load_state = -1
@@ -111,10 +110,12 @@ class ProcessInverterData:
         elif hex_data == self.engine.mqtt.LOAD_UTILITY:
             load_state = 0
 
+        fields = {}
         if charge_state != -1:
-            self.engine.mqtt.send_msg("chargeState", charge_state)
+            fields["chargeState"] = charge_state
         if load_state != -1:
-            self.engine.mqtt.send_msg("loadState", load_state)
+            fields["loadState"] = load_state
+        self._publish_fields(fields, device)
 
     def _get_data(self, data, idx, denominator):
         """Get float data from byte array"""
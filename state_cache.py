@@ -0,0 +1,112 @@
+import time
+from threading import Condition, Lock
+
+class StateCache:
+    """Latest decoded state per device, held as immutable snapshots.
+
+    Writers build a new snapshot and swap the reference under a lock;
+    readers only dereference the current mapping, so reads never wait on
+    the socket or decode threads. Every update bumps a global version that
+    long-poll and streaming readers can wait on.
+    """
+
+    def __init__(self, stale_after=30):
+        self.stale_after = stale_after
+        self._snapshots = {}
+        self._version = 0
+        self._write_lock = Lock()
+        self._changed = Condition(Lock())
+
+    @property
+    def version(self):
+        return self._version
+
+    def update(self, device, fields, timestamp=None):
+        """Merge decoded fields into the device's snapshot and publish it."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._write_lock:
+            previous = self._snapshots.get(device)
+            values = dict(previous["fields"]) if previous else {}
+            field_times = dict(previous["field_times"]) if previous else {}
+            for name, value in fields.items():
+                values[name] = value
+                field_times[name] = timestamp
+
+            version = self._version + 1
+            snapshot = {
+                "device": device,
+                "version": version,
+                # A device is only as fresh as its oldest field, so a partial
+                # update (e.g. a command response) does not hide stale values
+                "timestamp": min(field_times.values(), default=timestamp),
+                "updated": timestamp,
+                "fields": values,
+                "field_times": field_times,
+            }
+            snapshots = dict(self._snapshots)
+            snapshots[device] = snapshot
+            # Single reference assignments, atomic for readers
+            self._snapshots = snapshots
+            self._version = version
+
+        with self._changed:
+            self._changed.notify_all()
+        return snapshot
+
+    def get(self, device, now=None):
+        """Return the device's snapshot with its age and staleness, or None."""
+        snapshot = self._snapshots.get(device)
+        if snapshot is None:
+            return None
+        return self._with_age(snapshot, now)
+
+    def get_field(self, device, field, now=None):
+        """Return a single field with its own age and staleness, or None."""
+        snapshot = self._snapshots.get(device)
+        if snapshot is None or field not in snapshot["fields"]:
+            return None
+        if now is None:
+            now = time.time()
+        age = now - snapshot["field_times"][field]
+        return {
+            "device": device,
+            "field": field,
+            "value": snapshot["fields"][field],
+            "version": snapshot["version"],
+            "timestamp": snapshot["field_times"][field],
+            "age": age,
+            "stale": age > self.stale_after,
+        }
+
+    def get_all(self, now=None):
+        """Return every device's snapshot keyed by device."""
+        if now is None:
+            now = time.time()
+        snapshots = self._snapshots
+        return {device: self._with_age(snapshot, now) for device, snapshot in snapshots.items()}
+
+    def wait_for_change(self, since, timeout, device=None):
+        """Block until state newer than `since` exists or the timeout expires.
+
+        With `device`, only that device's snapshot counts. A `since` ahead
+        of the current version (e.g. held across a proxy restart) returns
+        at once so the client can resynchronise. Returns False on timeout.
+        """
+        def changed():
+            if since > self._version:
+                return True
+            if device is None:
+                return self._version > since
+            snapshot = self._snapshots.get(device)
+            return snapshot is not None and snapshot["version"] > since
+
+        with self._changed:
+            return self._changed.wait_for(changed, timeout)
+
+    def _with_age(self, snapshot, now=None):
+        if now is None:
+            now = time.time()
+        age = now - snapshot["timestamp"]
+        return dict(snapshot, age=age, stale=age > self.stale_after)
@@ -0,0 +1,126 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+class StateRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON endpoints over the engine's StateCache.
+
+    GET /state                         all devices
+    GET /state/<device>                one device
+    GET /state/<device>/<field>        one field
+    GET /state[/<device>]?since=N      long-poll until the (device) version passes N
+    GET /events                        Server-Sent Events stream of updates
+    """
+
+    server_version = "SmartESSState/1.0"
+    max_long_poll = 60  # seconds
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        try:
+            if parts == ["events"]:
+                self.stream_events()
+            elif parts and parts[0] == "state" and len(parts) <= 3:
+                self.get_state(parts[1:], query)
+            else:
+                self.send_json(404, {"error": "Not found"})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.server.logger.error(f"Error handling state request {self.path}: {e}")
+            self.send_json(500, {"error": str(e)})
+
+    def get_state(self, path, query):
+        cache = self.server.cache
+        if "since" in query:
+            try:
+                since = int(query["since"][0])
+                timeout = min(float(query.get("timeout", [30])[0]), self.max_long_poll)
+            except ValueError:
+                self.send_json(400, {"error": "since and timeout must be numbers"})
+                return
+            device = path[0] if path else None
+            if not cache.wait_for_change(since, timeout, device):
+                self.send_response(304)
+                self.end_headers()
+                return
+
+        if not path:
+            self.send_json(200, {"version": cache.version, "devices": cache.get_all()})
+            return
+
+        if len(path) == 1:
+            result = cache.get(path[0])
+        else:
+            result = cache.get_field(path[0], path[1])
+        if result is None:
+            self.send_json(404, {"error": f"Unknown device or field: {'/'.join(path)}"})
+        else:
+            self.send_json(200, result)
+
+    def stream_events(self):
+        cache = self.server.cache
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        version = cache.version
+        while not self.server.stopping:
+            if not cache.wait_for_change(version, self.server.keepalive_interval):
+                self.wfile.write(b": keepalive\n\n")
+            else:
+                # Track what was actually sent, updates may land after the wait
+                sent = version
+                for snapshot in cache.get_all().values():
+                    if snapshot["version"] > version:
+                        self.wfile.write(f"id: {snapshot['version']}\nevent: state\n"
+                                         f"data: {json.dumps(snapshot)}\n\n".encode())
+                        sent = max(sent, snapshot["version"])
+                version = sent
+            self.wfile.flush()
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        self.server.logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class StateServer:
+    """Serve the engine's state snapshots over HTTP on its own threads."""
+
+    def __init__(self, engine):
+        self.logger = logging.getLogger(__name__)
+        self.engine = engine
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(
+            (self.engine.state_api_host, self.engine.state_api_port), StateRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.cache = self.engine.state
+        self.httpd.logger = self.logger
+        self.httpd.keepalive_interval = 15
+        self.httpd.stopping = False
+        self.thread = Thread(target=self.httpd.serve_forever, name="state-server", daemon=True)
+        self.thread.start()
+        self.logger.info(f"State API listening on "
+                         f"http://{self.engine.state_api_host}:{self.httpd.server_port}/state")
+
+    def stop(self):
+        if self.httpd:
+            self.logger.info("Stopping state API...")
+            self.httpd.stopping = True
+            self.httpd.shutdown()
+            self.httpd.server_close()
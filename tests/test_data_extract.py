@@ -1,5 +1,7 @@
 import unittest
+from unittest.mock import MagicMock
 from process_inverter_data import ProcessInverterData
+from state_cache import StateCache
 
 class TestDataExtract(unittest.TestCase):
     def setUp(self):
@@ -64,6 +66,18 @@ class TestDataExtract(unittest.TestCase):
             else:
                 self.assertIsInstance(value, float)
 
+    def test_processor_updates_state(self):
+        """Test that decoded status fields are published and stored for the sending device"""
+        engine = MagicMock()
+        engine.state = StateCache()
+
+        ProcessInverterData(engine)._process_status_data(self.data, "192.168.1.50")
+
+        snapshot = engine.state.get("192.168.1.50")
+        self.assertEqual(len(snapshot["fields"]), 15)
+        self.assertEqual(snapshot["fields"]["outputVoltage"], 225.4)
+        self.assertEqual(engine.mqtt.send_msg.call_count, 15)
+
     def _get_data(self, data, idx, denominator):
         """Get float data from byte array"""
         value = self._get_bytes_as_int(data[idx:idx+2])
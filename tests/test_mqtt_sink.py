@@ -0,0 +1,179 @@
+import unittest
+import itertools
+import time
+from unittest.mock import MagicMock
+import paho.mqtt.client as mqtt
+from mqtt_sink import MQTTSink
+from mqtt_client import MQTTClient
+
+class TestMQTTSink(unittest.TestCase):
+    def setUp(self):
+        self.engine = MagicMock()
+        self.engine.payload_format = "json"
+        self.engine.payload_delta = False
+        self.engine.payload_keyframe_interval = 60
+        self.engine.last_data = None
+
+    def _config(self, name="local", **overrides):
+        config = {
+            'name': name,
+            'server': 'localhost',
+            'port': 1883,
+            'enable_auth': False,
+            'user': '',
+            'password': '',
+            'topic': f'{name}/inverter/',
+            'qos': 1,
+            'filter': ['*'],
+            'queue_size': 10,
+        }
+        config.update(overrides)
+        return config
+
+    def test_queue_drops_oldest_when_full(self):
+        """Test that a full queue drops the oldest message and counts it"""
+        sink = MQTTSink(self.engine, self._config(queue_size=3))
+        for value in range(5):
+            sink.enqueue("batteryVoltage", value)
+
+        values = [sink.queue.get_nowait()[1] for _ in range(sink.queue.qsize())]
+        self.assertEqual(values, [2, 3, 4])
+        metrics = sink.metrics()
+        self.assertEqual(metrics["enqueued"], 5)
+        self.assertEqual(metrics["dropped"], 2)
+
+    def test_filter(self):
+        """Test that only topics matching the filter patterns are queued"""
+        sink = MQTTSink(self.engine, self._config(filter=['data', 'battery*']))
+        self.assertTrue(sink.enqueue("batteryVoltage", 52.0))
+        self.assertTrue(sink.enqueue("data", b"\x00"))
+        self.assertFalse(sink.enqueue("pvPower", 100))
+        self.assertEqual(sink.queue.qsize(), 2)
+        self.assertEqual(sink.metrics()["filtered"], 1)
+
+    def test_publish_uses_prefix_and_qos(self):
+        """Test that messages are published with the sink's topic prefix and QoS"""
+        sink = MQTTSink(self.engine, self._config(qos=0))
+        sink.client = MagicMock()
+        sink.client.publish.return_value.rc = mqtt.MQTT_ERR_SUCCESS
+
+        self.assertTrue(sink.publish("batteryVoltage", 52.0, 0))
+        sink.client.publish.assert_called_once_with("local/inverter/batteryVoltage", "52.0", qos=0)
+
+    def test_failed_publish_forces_keyframe(self):
+        """Test that a failed data publish does not become the base for later deltas"""
+        self.engine.payload_format = "packed"
+        self.engine.payload_delta = True
+        sink = MQTTSink(self.engine, self._config())
+        sink.client = MagicMock()
+        sink.client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+
+        self.assertFalse(sink.publish("data", b"\x00\x01\x02\x03", 0))
+        self.assertEqual(sink.encoder.bases, {})
+
+    def test_oldest_pending_age(self):
+        """Test that the age of the oldest queued message is reported while nothing is published"""
+        sink = MQTTSink(self.engine, self._config())
+        self.assertEqual(sink.oldest_pending_age(), 0.0)
+        sink.queue.put_nowait(("pvPower", 100, 1000.0))
+        sink.queue.put_nowait(("pvPower", 120, 1010.0))
+        self.assertEqual(sink.oldest_pending_age(now=1030.0), 30.0)
+        self.assertIn("oldest_pending_age", sink.metrics())
+
+    def test_queue_size_is_bounded(self):
+        """Test that a non-positive queue size still gives a bounded queue"""
+        sink = MQTTSink(self.engine, self._config(queue_size=0))
+        for value in range(5):
+            sink.enqueue("pvPower", value)
+        self.assertEqual(sink.queue.qsize(), 1)
+        self.assertEqual(sink.metrics()["dropped"], 4)
+
+    def _stalled_client(self):
+        """A client that accepts publishes but never confirms them"""
+        client = MagicMock()
+        mids = itertools.count(1)
+
+        def publish(topic, payload, qos=0):
+            result = MagicMock()
+            result.rc = mqtt.MQTT_ERR_SUCCESS
+            result.mid = next(mids)
+            return result
+        client.publish.side_effect = publish
+        return client
+
+    def _wait_for(self, condition, timeout=2):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_slow_broker_backs_up_into_queue(self):
+        """Test that an unconfirmed in-flight window holds messages in the bounded queue"""
+        sink = MQTTSink(self.engine, self._config(queue_size=10))
+        sink.client = self._stalled_client()
+        sink.connected = True
+        sink.start()
+        try:
+            # Fill the in-flight window, then flood the queue behind it
+            for value in range(MQTTSink.MAX_INFLIGHT):
+                sink.enqueue("pvPower", value)
+                self.assertTrue(self._wait_for(lambda: sink.queue.qsize() == 0))
+            for value in range(100):
+                sink.enqueue("pvPower", value)
+            time.sleep(0.1)
+
+            metrics = sink.metrics()
+            self.assertEqual(sink.client.publish.call_count, MQTTSink.MAX_INFLIGHT)
+            self.assertEqual(metrics["inflight"], MQTTSink.MAX_INFLIGHT)
+            self.assertEqual(metrics["published"], 0)
+            self.assertGreater(metrics["dropped"], 0)
+            self.assertGreater(metrics["queue_depth"], 0)
+
+            # A confirmation frees a slot for the next queued message
+            sink.on_publish(sink.client, None, 1)
+            self.assertTrue(self._wait_for(
+                lambda: sink.client.publish.call_count == MQTTSink.MAX_INFLIGHT + 1))
+        finally:
+            sink.stop()
+            sink.thread.join(timeout=5)
+
+    def test_lag_is_measured_on_confirmation(self):
+        """Test that lag runs from enqueue until the broker confirms the message"""
+        sink = MQTTSink(self.engine, self._config())
+        sink.client = self._stalled_client()
+        sink.publish("pvPower", 100, time.time() - 30)
+        self.assertEqual(sink.metrics()["published"], 0)
+
+        sink.on_publish(sink.client, None, 1)
+        metrics = sink.metrics()
+        self.assertEqual(metrics["published"], 1)
+        self.assertEqual(metrics["inflight"], 0)
+        self.assertGreaterEqual(metrics["last_lag"], 30)
+
+    def test_paho_queue_full_counts_as_drop(self):
+        """Test that paho rejecting a message for a full queue is counted as a drop"""
+        sink = MQTTSink(self.engine, self._config())
+        sink.client = MagicMock()
+        sink.client.publish.return_value.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+        self.assertFalse(sink.publish("pvPower", 100, 0))
+        self.assertEqual(sink.metrics()["dropped"], 1)
+        self.assertEqual(sink.metrics()["failed"], 0)
+
+    def test_fan_out_is_independent(self):
+        """Test that a full sink does not affect delivery to the others"""
+        self.engine.mqtt_sinks = [
+            self._config("local", queue_size=100),
+            self._config("central", queue_size=2),
+        ]
+        client = MQTTClient(self.engine)
+        for value in range(5):
+            client.send_msg("pvPower", value)
+
+        metrics = client.metrics()
+        self.assertEqual(metrics["local"]["queue_depth"], 5)
+        self.assertEqual(metrics["local"]["dropped"], 0)
+        self.assertEqual(metrics["central"]["queue_depth"], 2)
+        self.assertEqual(metrics["central"]["dropped"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import json
+from payload_encoder import PayloadEncoder, PayloadDecoder, msgpack
+
+class TestPayloadEncoder(unittest.TestCase):
+    def setUp(self):
+        self.test_hex = "2B270925008205110000119511D10400CE08F301B90001007C00420000000000CE08F301100000000100010072B20000C1A200000100DC05DC05E60006007800E600F401060000000000F9231601D70F72006501020001000000020000003C00E6001E00740087007E007D0064008D003C0078001E0062ECE90E010000004A000000000000000000"
+        self.data = bytes.fromhex(self.test_hex)
+
+    def _changed(self, idx, value):
+        frame = bytearray(self.data)
+        frame[idx:idx+2] = value.to_bytes(2, byteorder='little')
+        return bytes(frame)
+
+    def test_json_matches_original_format(self):
+        """Test that the default format is the original JSON document"""
+        encoder = PayloadEncoder()
+        payload = json.loads(encoder.encode(self.data, timestamp=1700000000.5))
+        self.assertEqual(payload["raw_data"], self.data.hex())
+        self.assertEqual(payload["timestamp"], 1700000000.5)
+
+    def test_packed_roundtrip(self):
+        """Test that a packed keyframe decodes back to the raw frame"""
+        encoder = PayloadEncoder("packed")
+        payload = encoder.encode(self.data, timestamp=1700000000.5)
+        self.assertIsInstance(payload, bytes)
+        self.assertEqual(len(payload), PayloadEncoder.HEADER.size + len(self.data))
+
+        timestamp, frame = PayloadDecoder().decode_packed(payload)
+        self.assertEqual(timestamp, 1700000000.5)
+        self.assertEqual(frame, self.data)
+
+    def test_packed_delta_roundtrip(self):
+        """Test that delta payloads only carry changed runs and decode correctly"""
+        encoder = PayloadEncoder("packed", delta=True, keyframe_interval=10)
+        decoder = PayloadDecoder()
+        decoder.decode_packed(encoder.encode(self.data))
+
+        changed = self._changed(24, 520)  # battery voltage
+        payload = encoder.encode(changed)
+        self.assertLess(len(payload), PayloadEncoder.HEADER.size + 8)
+        _, frame = decoder.decode_packed(payload)
+        self.assertEqual(frame, changed)
+
+    def test_keyframe_interval(self):
+        """Test that a full frame is sent every keyframe_interval samples"""
+        encoder = PayloadEncoder("packed", delta=True, keyframe_interval=3)
+        sizes = [len(encoder.encode(self._changed(24, 500 + i))) for i in range(6)]
+        full = PayloadEncoder.HEADER.size + len(self.data)
+        self.assertEqual([size == full for size in sizes],
+                         [True, False, False, True, False, False])
+
+    def test_length_change_forces_keyframe(self):
+        """Test that a frame of a different length is sent in full"""
+        encoder = PayloadEncoder("packed", delta=True)
+        encoder.encode(self.data)
+        payload = encoder.encode(self.data[:-2])
+        _, frame = PayloadDecoder().decode_packed(payload)
+        self.assertEqual(frame, self.data[:-2])
+
+    def test_lost_delta_is_detected(self):
+        """Test that a delta applied after a lost sample is rejected until the next keyframe"""
+        encoder = PayloadEncoder("packed", delta=True, keyframe_interval=4)
+        payloads = [encoder.encode(self._changed(10, 500 + i)) for i in range(5)]
+        decoder = PayloadDecoder()
+
+        decoder.decode_packed(payloads[0])
+        # payloads[1] is lost
+        with self.assertRaises(ValueError):
+            decoder.decode_packed(payloads[2])
+        with self.assertRaises(ValueError):
+            decoder.decode_packed(payloads[3])
+
+        _, frame = decoder.decode_packed(payloads[4])  # keyframe
+        self.assertEqual(frame, self._changed(10, 504))
+
+    def test_interleaved_frame_types_keep_delta_chains(self):
+        """Test that status and command response frames each delta against their own type"""
+        response = bytes.fromhex("3D0A0001000EFF020102030405080C0E191A2041")
+        encoder = PayloadEncoder("packed", delta=True, keyframe_interval=10)
+        decoder = PayloadDecoder()
+        full = PayloadEncoder.HEADER.size + len(self.data)
+
+        frames = [self.data, response, self._changed(24, 520), response, self._changed(24, 521)]
+        sizes = []
+        for expected in frames:
+            payload = encoder.encode(expected)
+            sizes.append(len(payload))
+            _, frame = decoder.decode_packed(payload)
+            self.assertEqual(frame, expected)
+
+        self.assertEqual(sizes[0], full)
+        self.assertLess(sizes[2], PayloadEncoder.HEADER.size + 8)
+        self.assertLess(sizes[4], PayloadEncoder.HEADER.size + 8)
+
+    def test_reset_forces_keyframe(self):
+        """Test that reset() makes the next sample a keyframe"""
+        encoder = PayloadEncoder("packed", delta=True)
+        encoder.encode(self.data)
+        encoder.reset()
+        payload = encoder.encode(self._changed(24, 520))
+        self.assertEqual(len(payload), PayloadEncoder.HEADER.size + len(self.data))
+
+    @unittest.skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_roundtrip(self):
+        """Test that msgpack keyframes and deltas decode back to the raw frames"""
+        encoder = PayloadEncoder("msgpack", delta=True, keyframe_interval=10)
+        decoder = PayloadDecoder()
+
+        timestamp, frame = decoder.decode_msgpack(encoder.encode(self.data, timestamp=1700000000.5))
+        self.assertEqual(timestamp, 1700000000.5)
+        self.assertEqual(frame, self.data)
+
+        changed = self._changed(24, 520)
+        payload = encoder.encode(changed)
+        self.assertIn("d", msgpack.unpackb(payload, raw=False))
+        _, frame = decoder.decode_msgpack(payload)
+        self.assertEqual(frame, changed)
+
+    @unittest.skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_lost_delta_is_detected(self):
+        """Test that a msgpack delta applied after a lost sample is rejected"""
+        encoder = PayloadEncoder("msgpack", delta=True, keyframe_interval=10)
+        payloads = [encoder.encode(self._changed(10, 500 + i)) for i in range(3)]
+        decoder = PayloadDecoder()
+        decoder.decode_msgpack(payloads[0])
+        with self.assertRaises(ValueError):
+            decoder.decode_msgpack(payloads[2])
+
+    def test_stats(self):
+        """Test that bytes on the wire are reported against the JSON format"""
+        encoder = PayloadEncoder("packed")
+        encoder.encode(self.data)
+        stats = encoder.stats()
+        self.assertEqual(stats["samples"], 1)
+        self.assertEqual(stats["encoded_bytes"], PayloadEncoder.HEADER.size + len(self.data))
+        self.assertGreater(stats["baseline_bytes"], 2 * len(self.data))
+        self.assertGreater(stats["saved_ratio"], 0.5)
+
+    def test_unknown_format(self):
+        """Test that an unknown payload format is rejected"""
+        with self.assertRaises(ValueError):
+            PayloadEncoder("protobuf")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+import json
+import threading
+import time
+import urllib.request
+import urllib.error
+from unittest.mock import MagicMock
+from state_cache import StateCache
+from state_server import StateServer
+
+class TestStateCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = StateCache(stale_after=30)
+
+    def test_update_and_read(self):
+        """Test that field and bulk reads return the latest snapshot"""
+        self.cache.update("inverter", {"batteryVoltage": 52.0, "pvPower": 100}, timestamp=1000)
+        self.cache.update("inverter", {"pvPower": 120}, timestamp=1010)
+
+        snapshot = self.cache.get("inverter", now=1015)
+        self.assertEqual(snapshot["fields"], {"batteryVoltage": 52.0, "pvPower": 120})
+        self.assertEqual(snapshot["version"], 2)
+        self.assertEqual(snapshot["updated"], 1010)
+        self.assertEqual(snapshot["age"], 15)
+        self.assertFalse(snapshot["stale"])
+
+        field = self.cache.get_field("inverter", "batteryVoltage", now=1040)
+        self.assertEqual(field["value"], 52.0)
+        self.assertEqual(field["age"], 40)
+        self.assertTrue(field["stale"])
+
+        self.assertEqual(list(self.cache.get_all()), ["inverter"])
+        self.assertIsNone(self.cache.get("missing"))
+        self.assertIsNone(self.cache.get_field("inverter", "missing"))
+
+    def test_partial_update_keeps_device_stale(self):
+        """Test that updating some fields does not mark stale fields fresh"""
+        self.cache.update("inverter", {"batteryVoltage": 52.0, "chargeState": 2}, timestamp=1000)
+        self.cache.update("inverter", {"chargeState": 3}, timestamp=1050)
+
+        snapshot = self.cache.get("inverter", now=1055)
+        self.assertEqual(snapshot["timestamp"], 1000)
+        self.assertTrue(snapshot["stale"])
+        self.assertFalse(self.cache.get_field("inverter", "chargeState", now=1055)["stale"])
+
+    def test_snapshots_are_not_mutated(self):
+        """Test that an update swaps in a new snapshot instead of mutating the old one"""
+        self.cache.update("inverter", {"pvPower": 100})
+        before = self.cache.get("inverter")
+        self.cache.update("inverter", {"pvPower": 120})
+        self.assertEqual(before["fields"]["pvPower"], 100)
+
+    def test_wait_for_change(self):
+        """Test that waiters wake up on updates and time out otherwise"""
+        self.assertFalse(self.cache.wait_for_change(0, 0.01))
+
+        timer = threading.Timer(0.05, self.cache.update, args=("inverter", {"mode": 1}))
+        timer.start()
+        self.assertTrue(self.cache.wait_for_change(0, 5))
+        timer.join()
+
+    def test_wait_for_change_since_ahead(self):
+        """Test that a version from before a restart returns at once"""
+        self.cache.update("inverter", {"mode": 1})
+        start = time.time()
+        self.assertTrue(self.cache.wait_for_change(500, 5))
+        self.assertLess(time.time() - start, 1)
+
+    def test_wait_for_change_per_device(self):
+        """Test that a device wait ignores updates to other devices"""
+        self.cache.update("inverter", {"mode": 1})
+        self.cache.update("other", {"mode": 2})
+        self.assertFalse(self.cache.wait_for_change(1, 0.05, device="inverter"))
+
+        timer = threading.Timer(0.05, self.cache.update, args=("inverter", {"mode": 3}))
+        timer.start()
+        self.assertTrue(self.cache.wait_for_change(1, 5, device="inverter"))
+        timer.join()
+
+
+class TestStateServer(unittest.TestCase):
+    def setUp(self):
+        self.engine = MagicMock()
+        self.engine.state = StateCache()
+        self.engine.state_api_host = "127.0.0.1"
+        self.engine.state_api_port = 0  # Any free port
+        self.server = StateServer(self.engine)
+        self.server.start()
+        self.base_url = f"http://127.0.0.1:{self.server.httpd.server_port}"
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _get(self, path):
+        with urllib.request.urlopen(f"{self.base_url}{path}", timeout=5) as response:
+            return response.status, json.loads(response.read() or b"null")
+
+    def test_state_endpoints(self):
+        """Test bulk, device and field reads over HTTP"""
+        self.engine.state.update("inverter", {"batteryVoltage": 52.0})
+
+        status, body = self._get("/state")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["devices"]["inverter"]["fields"]["batteryVoltage"], 52.0)
+
+        status, body = self._get("/state/inverter")
+        self.assertEqual(body["version"], 1)
+
+        status, body = self._get("/state/inverter/batteryVoltage")
+        self.assertEqual(body["value"], 52.0)
+
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self._get("/state/inverter/missing")
+        self.assertEqual(ctx.exception.code, 404)
+
+    def test_long_poll(self):
+        """Test that a long-poll returns once the state changes"""
+        timer = threading.Timer(0.05, self.engine.state.update, args=("inverter", {"mode": 1}))
+        timer.start()
+        status, body = self._get("/state?since=0&timeout=5")
+        timer.join()
+        self.assertEqual(status, 200)
+        self.assertEqual(body["version"], 1)
+
+    def test_long_poll_since_ahead(self):
+        """Test that a long-poll with a version from before a restart returns at once"""
+        self.engine.state.update("inverter", {"mode": 1})
+        status, body = self._get("/state?since=500&timeout=5")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["version"], 1)
+
+    def test_device_long_poll_ignores_other_devices(self):
+        """Test that a per-device long-poll waits for that device's own update"""
+        self.engine.state.update("inverter", {"mode": 1})
+        other = threading.Timer(0.05, self.engine.state.update, args=("other", {"mode": 2}))
+        mine = threading.Timer(0.3, self.engine.state.update, args=("inverter", {"mode": 3}))
+        other.start()
+        mine.start()
+        status, body = self._get("/state/inverter?since=1&timeout=5")
+        other.join()
+        mine.join()
+        self.assertEqual(status, 200)
+        self.assertEqual(body["version"], 3)
+        self.assertEqual(body["fields"]["mode"], 3)
+
+    def test_events_stream(self):
+        """Test that /events streams a state event with the snapshot version as id"""
+        timer = threading.Timer(0.1, self.engine.state.update, args=("inverter", {"mode": 1}))
+        with urllib.request.urlopen(f"{self.base_url}/events", timeout=5) as response:
+            timer.start()
+            lines = []
+            while b"event: state\n" not in lines:
+                lines.append(response.readline())
+            event = response.readline()
+        timer.join()
+
+        self.assertEqual(lines[-2], b"id: 1\n")
+        self.assertTrue(event.startswith(b"data: "))
+        self.assertEqual(json.loads(event[len(b"data: "):])["fields"]["mode"], 1)
+
+if __name__ == '__main__':
+    unittest.main()